@@ -0,0 +1,27 @@
+from typing import List
+
+# ====================================================================
+# BIT-PACKED MOTIFS
+# A motif of length n is packed 2 bits per char into a Python int, the
+# first char in the highest lane (same layout as Motif.set_from_kmer):
+# char j lives at bit position 2 * (n - 1 - j).
+# ====================================================================
+
+# Folds every encoded char onto a base-4 digit (the wildcard '4' becomes '0',
+# matching the `& 0b11` of Motif.set_from_kmer), so int(..., 4) can pack it.
+_TO_BASE4 = str.maketrans('456789', '012301')
+
+
+def pack(kmer: str) -> int:
+    """Packs an ENCODED kmer string (e.g., "0123") into an int."""
+    return int(kmer.translate(_TO_BASE4), 4) if kmer else 0
+
+
+def expand(packed: int, wild_mask: int, length: int) -> List[int]:
+    """Expands every wildcard lane (bit j of `wild_mask`, lane order as above) into all 4 codes."""
+    motifs = [packed]
+    for j in range(length):
+        if (wild_mask >> j) & 1:
+            p = 2 * j
+            motifs = [(m & ~(0b11 << p)) | (code << p) for m in motifs for code in range(4)]
+    return motifs
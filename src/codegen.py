@@ -0,0 +1,307 @@
+from functools import lru_cache
+from typing import Callable, List, Tuple
+
+# ====================================================================
+# RUNTIME CODE GENERATION
+# (l, d) are fixed for a whole run, so the neighborhood generators are
+# emitted as Python source with every bound, error count and bit edit
+# written out as literals, then compiled once per parameter set.
+# Packed kmers use the bit_motif.py layout (2 bits per char).
+# ====================================================================
+
+# Empty child slot in motif_tree.NodeStore
+NO_NODE = -1
+
+# Largest template set build_template_fn unrolls into generated source
+TEMPLATE_UNROLL_LIMIT = 4096
+
+def _compile_all(src: str, names: List[str], filename: str) -> Tuple[Callable, ...]:
+    namespace: dict = {}
+    exec(compile(src, filename, 'exec'), namespace)
+    return tuple(namespace[name] for name in names)
+
+
+def _compile(src: str, name: str, filename: str) -> Callable:
+    return _compile_all(src, [name], filename)[0]
+
+
+def _nbd_level_src(l: int, e: int) -> List[str]:
+    """Source of the Ems1 recursion level with `e` errors remaining (e >= 1)."""
+    lines = [f"def nbd_{e}(packed, length, add):"]
+
+    if e == 1:
+        # Last edit: only results of length l are kept, so emit them directly
+        lines += [
+            f"    if length == {l + 1}:",
+            f"        for p in range(0, {2 * (l + 1)}, 2):",
+            "            add(((packed >> (p + 2)) << p) | (packed & ((1 << p) - 1)))",
+            f"    elif length == {l}:",
+            f"        for p in range(0, {2 * l}, 2):",
+            "            orig = (packed >> p) & 3",
+            "            cleared = packed & ~(3 << p)",
+        ]
+        lines += [f"            if orig != {c}: add(cleared | ({c} << p))" for c in range(4)]
+        if l > 1:
+            lines += [
+                f"    elif length == {l - 1}:",
+                f"        for p in range(0, {2 * l}, 2):",
+                "            base = ((packed >> p) << (p + 2)) | (packed & ((1 << p) - 1))",
+            ]
+            lines += [f"            add(base | ({c} << p))" for c in range(4)]
+        return lines
+
+    lines += [f"    if length < {l - e} or length > {l + e}: return"]
+
+    # 1. Deletion (del)
+    lines += [
+        f"    if length >= {max(1, l - e + 1)}:",
+        "        for p in range(0, 2 * length, 2):",
+        f"            nbd_{e - 1}(((packed >> (p + 2)) << p) | (packed & ((1 << p) - 1)), length - 1, add)",
+    ]
+
+    # 2. Substitution (sub)
+    lines += [
+        "    for p in range(0, 2 * length, 2):",
+        "        orig = (packed >> p) & 3",
+        "        cleared = packed & ~(3 << p)",
+    ]
+    lines += [f"        if orig != {c}: nbd_{e - 1}(cleared | ({c} << p), length, add)" for c in range(4)]
+
+    # 3. Insertion (ins)
+    lines += [
+        f"    if length <= {l + e - 1}:",
+        "        for p in range(0, 2 * length + 2, 2):",
+        "            base = ((packed >> p) << (p + 2)) | (packed & ((1 << p) - 1))",
+    ]
+    lines += [f"            nbd_{e - 1}(base | ({c} << p), length + 1, add)" for c in range(4)]
+    return lines
+
+
+@lru_cache(maxsize=None)
+def build_nbd_fn(l: int, d: int) -> Callable[[int, int, Callable[[int], None]], None]:
+    """
+    Returns nbd(packed, length, add): the Ems1 (l, d) neighborhood recursion
+    specialized for (l, d), calling add(motif) for every length-l result.
+    """
+    if d == 0:
+        return _compile(f"def nbd_0(packed, length, add):\n    if length == {l}: add(packed)\n",
+                        "nbd_0", f"<nbd l={l} d=0>")
+
+    lines: List[str] = []
+    for e in range(1, d + 1):
+        lines += _nbd_level_src(l, e)
+        lines.append("")
+    return _compile("\n".join(lines), f"nbd_{d}", f"<nbd l={l} d={d}>")
+
+
+def build_template_fn(templates: tuple, name: str) -> Callable[[int], tuple]:
+    """
+    Returns apply_all(packed): the pattern of every template (see nbd_kernel.py)
+    for a packed kmer, in template order, as one unrolled tuple expression.
+    Above TEMPLATE_UNROLL_LIMIT templates the source would take seconds and
+    hundreds of MB to compile, so the blocks are looped over instead.
+    """
+    if len(templates) > TEMPLATE_UNROLL_LIMIT:
+        block_lists = tuple(blocks for blocks, _ in templates)
+
+        def apply_all(packed: int) -> tuple:
+            patterns = []
+            for blocks in block_lists:
+                pattern = 0
+                for src_shift, dst_shift, mask in blocks:
+                    pattern |= ((packed >> src_shift) & mask) << dst_shift
+                patterns.append(pattern)
+            return tuple(patterns)
+        return apply_all
+
+    exprs = []
+    for blocks, _ in templates:
+        terms = [f"((packed >> {src_shift}) & {mask}) << {dst_shift}" for src_shift, dst_shift, mask in blocks]
+        exprs.append(" | ".join(terms) if terms else "0")
+
+    src = "def apply_all(packed):\n    return (\n" + "".join(f"        {expr},\n" for expr in exprs) + "    )\n"
+    return _compile(src, "apply_all", f"<{name}>")
+
+
+def _fast_insert_level_src(depth: int, max_depth: int, domain_size: int, wildcard_code: int) -> List[str]:
+    """Source of the MotifTreeFast insert recursion at `depth` (see motif_tree.py)."""
+    name, next_name = f"insert_{depth}", f"insert_{depth + 1}"
+    if depth == max_depth:
+        return [f"def {name}(children, sharing, occ, codes, node):", "    return"]
+
+    mask = (1 << domain_size) - 1
+    return [
+        f"def {name}(children, sharing, occ, codes, node):",
+        f"    ch = codes[{depth}]",
+        f"    base = node * {domain_size}",
+        f"    if ch == {wildcard_code}:",
+        "        current_info = 0",
+        "        pending = occ[node]",
+        "        while pending:",
+        "            low = pending & -pending",
+        "            child_node = children[base + low.bit_length() - 1]",
+        f"            {next_name}(children, sharing, occ, codes, child_node)",
+        "            current_info |= sharing[child_node]",
+        "            pending &= ~(current_info | low)",
+        f"        remaining = ~current_info & {mask}",
+        "        if remaining:",
+        "            new_node = alloc(children, sharing, occ, remaining)",
+        "            bits = remaining",
+        "            while bits:",
+        "                low = bits & -bits",
+        "                children[base + low.bit_length() - 1] = new_node",
+        "                bits ^= low",
+        "            occ[node] |= remaining",
+        f"            {next_name}(children, sharing, occ, codes, new_node)",
+        "    else:",
+        "        child_mask = 1 << ch",
+        "        child_node = children[base + ch]",
+        f"        if child_node == {NO_NODE}:",
+        "            new_node = alloc(children, sharing, occ, child_mask)",
+        "            children[base + ch] = new_node",
+        "            occ[node] |= child_mask",
+        f"            {next_name}(children, sharing, occ, codes, new_node)",
+        "        elif sharing[child_node] & ~child_mask:",
+        # Other slots still share the child: give this slot its own copy of
+        # the subtree, so the patterns already under it are kept
+        "            new_node = copy_subtree(children, sharing, occ, child_node)",
+        "            sharing[new_node] = child_mask",
+        "            sharing[child_node] &= ~child_mask",
+        "            children[base + ch] = new_node",
+        f"            {next_name}(children, sharing, occ, codes, new_node)",
+        "        else:",
+        f"            {next_name}(children, sharing, occ, codes, child_node)",
+    ]
+
+
+def _fast_intersect_level_src(depth: int, max_depth: int, domain_size: int) -> List[str]:
+    """
+    Source of the MotifTreeFast intersect recursion at `depth` (see motif_tree.py).
+    The to-tree is read from the to_* arrays and the result is built in the
+    children/sharing/occ arrays of a separate store.
+    """
+    name, next_name = f"intersect_{depth}", f"intersect_{depth + 1}"
+    signature = (f"def {name}(to_children, to_sharing, to_occ, children, sharing, occ,"
+                 " from_children, from_sharing, to_node, from_node):")
+    if depth == max_depth:
+        return [signature, "    return alloc(children, sharing, occ, 0)"]
+
+    lines = [
+        signature,
+        f"    if from_node == {NO_NODE}: return {NO_NODE}",
+        "    new_to_node = alloc(children, sharing, occ, 0)",
+        f"    to_base = to_node * {domain_size}",
+        f"    from_base = from_node * {domain_size}",
+        f"    new_base = new_to_node * {domain_size}",
+        "    pending = to_occ[to_node]",
+        "    while pending:",
+        "        low = pending & -pending",
+        "        pending ^= low",
+        "        j = low.bit_length() - 1",
+        "        to_child = to_children[to_base + j]",
+        "        from_child = from_children[from_base + j]",
+        f"        if from_child == {NO_NODE}: continue",
+        "        common = to_sharing[to_child] & from_sharing[from_child]",
+        "        if common:",
+        f"            intersected_child = {next_name}(to_children, to_sharing, to_occ, children, sharing, occ,",
+        "                                            from_children, from_sharing, to_child, from_child)",
+        f"            if intersected_child != {NO_NODE}:",
+        "                sharing[intersected_child] = common",
+    ]
+    lines += [
+        # Usually one code (no wildcard here): link its slot without the bit loop
+        "                if not common & (common - 1):",
+        "                    children[new_base + common.bit_length() - 1] = intersected_child",
+        "                else:",
+        "                    bits = common",
+        "                    while bits:",
+        "                        low_k = bits & -bits",
+        "                        children[new_base + low_k.bit_length() - 1] = intersected_child",
+        "                        bits ^= low_k",
+        "                occ[new_to_node] |= common",
+        "                sharing[new_to_node] |= common",
+        f"    if occ[new_to_node] == 0: return {NO_NODE}",
+        "    return new_to_node",
+    ]
+    return lines
+
+
+@lru_cache(maxsize=None)
+def build_fast_tree_fns(max_depth: int, domain_size: int, wildcard_code: int) -> Tuple[Tuple[Callable, ...], Tuple[Callable, ...]]:
+    """
+    Returns (inserts, intersects): the MotifTreeFast recursions over NodeStore
+    arrays, one function per depth (index = depth, up to max_depth), with the
+    depth, domain size, masks and the NO_NODE marker written in as literals.
+    """
+    lines = [
+        "from array import array",
+        f"EMPTY_SLOTS = array('i', [{NO_NODE}] * {domain_size})",
+        "",
+        "def alloc(children, sharing, occ, sharing_info):",
+        "    nid = len(sharing)",
+        "    children.extend(EMPTY_SLOTS)",
+        "    sharing.append(sharing_info)",
+        "    occ.append(0)",
+        "    return nid",
+        "",
+        # Slots sharing one child keep sharing its copy; leaves have no slots
+        "def copy_subtree(children, sharing, occ, node):",
+        "    new_node = alloc(children, sharing, occ, sharing[node])",
+        "    pending = occ[node]",
+        "    if pending:",
+        f"        base = node * {domain_size}",
+        f"        new_base = new_node * {domain_size}",
+        "        occ[new_node] = pending",
+        "        copies = {}",
+        "        while pending:",
+        "            low = pending & -pending",
+        "            pending ^= low",
+        "            j = low.bit_length() - 1",
+        "            child = children[base + j]",
+        "            new_child = copies.get(child)",
+        "            if new_child is None:",
+        "                new_child = copies[child] = copy_subtree(children, sharing, occ, child)",
+        "            children[new_base + j] = new_child",
+        "    return new_node",
+        "",
+    ]
+    for depth in range(max_depth + 1):
+        lines += _fast_insert_level_src(depth, max_depth, domain_size, wildcard_code)
+        lines.append("")
+        lines += _fast_intersect_level_src(depth, max_depth, domain_size)
+        lines.append("")
+
+    fns = _compile_all("\n".join(lines),
+                       [f"{kind}_{depth}" for kind in ("insert", "intersect") for depth in range(max_depth + 1)],
+                       f"<fast tree depth={max_depth}>")
+    return fns[:max_depth + 1], fns[max_depth + 1:]
+
+
+@lru_cache(maxsize=None)
+def build_simple_insert_fns(max_depth: int, domain_size: int, wildcard_code: int) -> Tuple[Callable, ...]:
+    """
+    Returns the MotifTreeSimple insert recursion, one function
+    insert_d(alloc, node, codes) per depth d (index = depth, up to max_depth).
+    """
+    mask = (1 << domain_size) - 1
+    lines: List[str] = []
+    for depth in range(max_depth):
+        next_name = f"insert_{depth + 1}"
+        lines += [
+            f"def insert_{depth}(alloc, node, codes):",
+            f"    ch = codes[{depth}]",
+            f"    target_info = {mask} if ch == {wildcard_code} else 1 << ch",
+            "    for child in node.children:",
+            "        if child.sharing_info & target_info:",
+            f"            {next_name}(alloc, child, codes)",
+            "            return",
+            "    new_node = alloc()",
+            "    new_node.sharing_info = target_info",
+            "    node.children.append(new_node)",
+            f"    {next_name}(alloc, new_node, codes)",
+            "",
+        ]
+    lines += [f"def insert_{max_depth}(alloc, node, codes):", "    return", ""]
+
+    return _compile_all("\n".join(lines), [f"insert_{depth}" for depth in range(max_depth + 1)],
+                        f"<simple tree depth={max_depth}>")
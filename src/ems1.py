@@ -1,5 +1,7 @@
 from motif_finder import MotifFinderBase
-from utils import Params, decode_motif
+from utils import Params, decode_motif, pack_all_kmers
+from motif_data import unpack_kmer
+from codegen import build_nbd_fn
 from typing import Dict, List, Set, Any
 import itertools
 
@@ -12,74 +14,78 @@ class Ems1(MotifFinderBase):
     def __init__(self, input_path: str, l: int, d: int, params: Params):
         super().__init__("ems1", input_path, l, d, params)
         
-        # Equivalent of A2 (motif counts) and A1 (last sequence ID matched)
-        self.motif_counts: Dict[str, int] = {} 
-        self.last_seq_match: Dict[str, int] = {}
+        # Equivalent of A2 (motif counts) and A1 (last sequence ID matched), keyed by packed motif
+        self.motif_counts: Dict[int, int] = {} 
+        self.last_seq_match: Dict[int, int] = {}
 
-    def _generate_neighborhood(self, kmer: str, errors_remaining: int, length: int, current_motif_set: Set[str]):
-        """
-        Recursively generates the (l, d) neighborhood (Deletions, Substitutions, Insertions).
-        """
-        current_len = len(kmer)
-
-        if errors_remaining == 0:
-            if current_len == length:
-                current_motif_set.add(kmer)
-            return
-
-        # Pruning check
-        if current_len < length - errors_remaining or current_len > length + errors_remaining:
-             return
+    def _kmers_by_length(self, seq_codes: bytes) -> Dict[int, List[int]]:
+        """Packed kmers of every length in [l - d, l + d] that fits the sequence."""
+        kmers_by_length: Dict[int, List[int]] = {}
+        for q in range(-self.d, self.d + 1):
+            k = self.l + q
+            
+            if k <= 0 or k > len(seq_codes): continue
 
-        # 1. Deletion (del)
-        if current_len > 0 and current_len >= length - errors_remaining + 1:
-            for j in range(current_len):
-                new_kmer = kmer[:j] + kmer[j+1:]
-                self._generate_neighborhood(new_kmer, errors_remaining - 1, length, current_motif_set)
-        
-        # 2. Substitution (sub)
-        for j in range(current_len):
-            original_char = kmer[j]
-            for k in range(self.domain_size):
-                new_char_code = str(k)
-                if new_char_code != original_char:
-                    new_kmer = kmer[:j] + new_char_code + kmer[j+1:]
-                    self._generate_neighborhood(new_kmer, errors_remaining - 1, length, current_motif_set)
-                    
-        # 3. Insertion (ins)
-        if current_len <= length + errors_remaining - 1:
-            for j in range(current_len + 1):
-                for k in range(self.domain_size):
-                    new_char_code = str(k)
-                    new_kmer = kmer[:j] + new_char_code + kmer[j:]
-                    self._generate_neighborhood(new_kmer, errors_remaining - 1, length, current_motif_set)
+            kmers = pack_all_kmers(seq_codes, k)
+            if self.params.dedup_kmers:
+                kmers = list(dict.fromkeys(kmers))
+            kmers_by_length[k] = kmers
+        return kmers_by_length
 
+    def _surviving_candidates(self, kmers_by_length: Dict[int, List[int]]) -> Set[int]:
+        """
+        Candidate-driven pass: keeps the tracked candidates within d edits of
+        some kmer of the sequence, by generating each candidate's own length-k
+        neighbors (edits are invertible, so this is the same relation) and
+        probing the kmer set instead of expanding every kmer.
+        """
+        found: Set[int] = set()
+        for k, kmers in kmers_by_length.items():
+            kmer_set = set(kmers)
+            nbd = build_nbd_fn(k, self.d)
+            for candidate_motif in self.motif_counts.keys() - found:
+                neighbors: Set[int] = set()
+                nbd(candidate_motif, self.l, neighbors.add)
+                if not neighbors.isdisjoint(kmer_set):
+                    found.add(candidate_motif)
+        return found
 
     def search(self):
-        n_reads = len(self.reads)
+        n_reads = len(self.read_codes)
+        nbd = build_nbd_fn(self.l, self.d)
         
-        for i, seq in enumerate(self.reads):
+        for i, seq_codes in enumerate(self.read_codes):
             current_seq_id = i + 1
             print(f"Processing sequence {i+1}...")
             
-            sequence_candidates: Set[str] = set()
+            kmers_by_length = self._kmers_by_length(seq_codes)
+            n_kmers = sum(len(kmers) for kmers in kmers_by_length.values())
 
-            for q in range(-self.d, self.d + 1):
-                k = self.l + q
-                
-                if k <= 0 or k > len(seq): continue
-
-                for start_index in range(len(seq) - k + 1):
-                    kmer = seq[start_index : start_index + k]
-                    
-                    self._generate_neighborhood(kmer, self.d, self.l, sequence_candidates)
+            # Past the first sequence only tracked candidates can still match, so
+            # check those directly when that takes fewer expansions
+            if i > 0 and len(self.motif_counts) * len(kmers_by_length) < n_kmers:
+                sequence_candidates = self._surviving_candidates(kmers_by_length)
+            else:
+                sequence_candidates: Set[int] = set()
+                add_candidate = sequence_candidates.add
+                for k, kmers in kmers_by_length.items():
+                    for packed in kmers:
+                        nbd(packed, k, add_candidate)
 
             for candidate_motif in sequence_candidates:
                 if self.last_seq_match.get(candidate_motif) != current_seq_id:
                     self.last_seq_match[candidate_motif] = current_seq_id
                     self.motif_counts[candidate_motif] = self.motif_counts.get(candidate_motif, 0) + 1
+
+            # A candidate missing from any sequence so far can never reach n_reads
+            if i > 0:
+                self.motif_counts = {motif: count for motif, count in self.motif_counts.items()
+                                     if count == current_seq_id}
+                self.last_seq_match = dict.fromkeys(self.motif_counts, current_seq_id)
                     
             print(f"Done. Current candidate pool size: {len(self.motif_counts)}")
+            if not self.motif_counts:
+                break
 
-        self.motifs = [motif_encoded for motif_encoded, count in self.motif_counts.items() if count == n_reads]
-        self.motifs.sort()
\ No newline at end of file
+        matched = sorted(packed for packed, count in self.motif_counts.items() if count == n_reads)
+        self.motifs = [unpack_kmer(packed, self.l) for packed in matched]
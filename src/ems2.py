@@ -1,13 +1,17 @@
 from motif_finder import MotifFinderBase
-from utils import Params, WILDCARD_CODE, decode_motif
+from utils import Params, WILDCARD_STR, decode_motif, pack_all_kmers
+from motif_data import unpack_kmer
 from motif_tree import MotifTreeBase, MotifTreeFast, MotifTreeSimple
-from typing import Dict, List, Optional
-import math
+from bit_motif import expand
+from nbd_kernel import gen_unique
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 class Ems2(MotifFinderBase):
     """
     Implements EMS Version 2 (ems2 and ems2m): Iterative intersection of motif 
     candidates using a Motif Tree (replaces C++ Ems2).
+    By default ems2 instead intersects sorted lists of packed motifs (Python
+    ints, so any l fits); Params.ems2_tree runs it on MotifTreeFast.
     """
     
     TREE_MAP = {
@@ -23,114 +27,112 @@ class Ems2(MotifFinderBase):
              
         self.main_tree: Optional[MotifTreeBase] = None
         self.TreeClass = TreeClass
-        self.kmer: str = ""
-        self.l_target = str(WILDCARD_CODE) 
+        self.use_sorted = version == "ems2" and not params.ems2_tree
+        self.main_array: List[int] = []
+        self.l_target = WILDCARD_STR
+        self._wildcard_byte = ord(self.l_target)
+        self._pattern_buf = bytearray(l)
         self.leftmost = False
         self.rightmost = False
 
-    # The recursive neighborhood generation functions (delta/sigma/alpha decomposition)
-
-    def _gen_nbrhood_3(self, alpha: int, tree: MotifTreeBase):
-        """Handles insertions ('*')."""
-        current_kmer = self.kmer 
-        current_len = len(current_kmer)
+    def _pattern_str(self, packed: int, wild_mask: int) -> str:
+        """Unpacks a length-l pattern to the encoded string form the motif trees insert."""
+        buf = self._pattern_buf
+        wildcard_byte = self._wildcard_byte
+        # Lowest lanes hold the last chars, so fill the buffer from the end in place
+        for j in range(self.l - 1, -1, -1):
+            buf[j] = wildcard_byte if wild_mask & 1 else 0x30 + (packed & 0b11)
+            packed >>= 2
+            wild_mask >>= 1
+        return buf.decode('ascii')
+
+    def _gen_patterns(self, seq_codes: bytes) -> Iterator[Tuple[int, int]]:
+        """Iterates through all possible k-mer lengths, yielding each kmer's distinct neighbor patterns."""
+        m = len(seq_codes)
         
-        if alpha == 0:
-            # Base Case: Motif is complete. Filter out deletion markers ('-')
-            t = "".join(c for c in current_kmer if c != '-')
-            t = t.replace('*', self.l_target)
-            
-            if len(t) == self.l:
-                tree.insert(t)
-            return
-
-        # Recursive Step: Insertion
-        for j in range(current_len + 1):
-            if j < current_len and current_kmer[j] == '*': continue
+        for q in range(-self.d, self.d + 1):
+            k = self.l + q 
             
-            # Temporarily insert '*'
-            self.kmer = current_kmer[:j] + '*' + current_kmer[j:]
-            self._gen_nbrhood_3(alpha - 1, tree) 
-            self.kmer = current_kmer # Backtrack
+            if k <= 0 or k > m: continue
 
+            kmers = pack_all_kmers(seq_codes, k)
+            if self.params.dedup_kmers:
+                kmers = list(dict.fromkeys(kmers))
+
+            for packed_kmer in kmers:
+                patterns: List[int] = []
+                wild_masks: List[int] = []
+                gen_unique(packed_kmer, k, self.l, self.d, patterns, wild_masks)
+                yield from zip(patterns, wild_masks)
+
+    def _gen_all(self, seq_codes: bytes, tree: MotifTreeBase):
+        """Inserts every neighbor pattern of the sequence into the tree."""
+        for packed, wild_mask in self._gen_patterns(seq_codes):
+            tree.insert(self._pattern_str(packed, wild_mask))
+
+    def _gen_motifs(self, seq_codes: bytes) -> Set[int]:
+        """Collects every motif of the sequence's neighborhood as packed ints, expanding wildcards."""
+        motifs: Set[int] = set()
+        for packed, wild_mask in self._gen_patterns(seq_codes):
+            if not wild_mask:
+                motifs.add(packed)
+            else:
+                motifs.update(expand(packed, wild_mask, self.l))
+        return motifs
+
+    def _search_sorted(self):
+        print("Processing sequence 0...")
+        self.main_array = sorted(self._gen_motifs(self.read_codes[0]))
+
+        for i in range(1, len(self.read_codes)):
+            print(f"Processing sequence {i}...")
 
-    def _gen_nbrhood_2(self, sigma: int, alpha: int, tree: MotifTreeBase):
-        """Handles substitutions ('*')."""
-        current_kmer = self.kmer
-        current_len = len(current_kmer)
+            # main_array is sorted, so filtering it keeps the result sorted
+            tmp_motifs = self._gen_motifs(self.read_codes[i])
+            self.main_array = [data for data in self.main_array if data in tmp_motifs]
 
-        if sigma == 0:
-            self._gen_nbrhood_3(alpha, tree)
-            return
+            if not self.main_array:
+                self.motifs.clear()
+                print("No common motifs found after intersection. Stopping.")
+                return
 
-        # Recursive Step: Substitution
-        for j in range(current_len):
-            if current_kmer[j] == '-': continue
-            
-            t = current_kmer[j]
-            # Substitute with '*'
-            self.kmer = current_kmer[:j] + '*' + current_kmer[j+1:]
-            self._gen_nbrhood_2(sigma - 1, alpha, tree)
-            self.kmer = current_kmer[:j] + t + current_kmer[j+1:] # Backtrack
+        self.motifs = [unpack_kmer(data, self.l) for data in self.main_array]
 
+    def search(self):
+        if not self.read_codes: return
 
-    def _gen_nbrhood(self, delta: int, sigma: int, alpha: int, tree: MotifTreeBase):
-        """Handles deletions ('-')."""
-        current_kmer = self.kmer
-        current_len = len(current_kmer)
-        
-        if delta == 0:
-            self._gen_nbrhood_2(sigma, alpha, tree)
+        if self.use_sorted:
+            self._search_sorted()
             return
-
-        # Recursive Step: Deletion
-        for j in range(current_len):
-            original_char = current_kmer[j]
-            
-            # Substitute with deletion marker '-'
-            self.kmer = current_kmer[:j] + '-' + current_kmer[j+1:]
-            self._gen_nbrhood(delta - 1, sigma, alpha, tree)
-            self.kmer = current_kmer[:j] + original_char + self.kmer[j+1:] # Backtrack, fixing length
-
-
-    def _gen_all(self, seq: str, tree: MotifTreeBase):
-        """Iterates through all possible k-mer lengths and error partitions."""
-        m = len(seq)
-        
-        for q in range(-self.d, self.d + 1):
-            k = self.l + q 
-            
-            if k <= 0 or k > m: continue
-
-            for delta in range(max(0, q), math.floor((self.d + q) / 2) + 1):
-                alpha = delta - q 
-                sigma = self.d - alpha - delta
-                
-                for i in range(m - k + 1):
-                    self.kmer = seq[i : i + k]
-                    
-                    self._gen_nbrhood(delta, sigma, alpha, tree)
-
-    def search(self):
-        if not self.reads: return
             
         print(f"Processing sequence 0...")
         self.main_tree = self.TreeClass(self.l, self.motifs, "main")
-        self._gen_all(self.reads[0], self.main_tree)
+        self._gen_all(self.read_codes[0], self.main_tree)
         
-        for i in range(1, len(self.reads)):
+        n_reads = len(self.read_codes)
+        for i in range(1, n_reads):
             print(f"Processing sequence {i}...")
             
             tmp_motifs: List[str] = []
             tmp_tree = self.TreeClass(self.l, tmp_motifs, "tmp") 
             
-            self._gen_all(self.reads[i], tmp_tree)
+            self._gen_all(self.read_codes[i], tmp_tree)
+
+            if i == n_reads - 1 and self.TreeClass.STREAM_FINAL:
+                # Last sequence: stream the common motifs instead of building the final tree
+                self.main_tree.clear_pool()
+                self.motifs.clear()
+                self.motifs.extend(self.main_tree.stream_intersect(tmp_tree))
+                self.motifs.sort()
+                return
+
             self.main_tree.intersect(tmp_tree)
             
-            if not self.main_tree.root['children']: 
+            if self.main_tree.is_empty(): 
                 self.motifs.clear()
                 print("No common motifs found after intersection. Stopping.")
                 return
 
+        self.main_tree.clear_pool()
         self.main_tree.traverse()
         self.motifs.sort()
\ No newline at end of file
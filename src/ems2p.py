@@ -1,186 +1,149 @@
 from motif_finder import MotifFinderBase
-from utils import Params, WILDCARD_CODE, uint64, uint32, decode_motif
-from motif_data import Motif, Auxif
-from typing import Dict, List, Optional, Tuple, Set, Any
+from utils import Params, uint64, uint32, decode_motif, pack_all_kmers
+from motif_data import MAX_L, unpack_kmer
+from motif_set import MotifSet
+from bit_motif import expand
+from nbd_kernel import template_fn, template_wild_masks
+from typing import Dict, Iterable, List, Optional, Tuple, Set, Any
 import math
 import multiprocessing as mp
+import multiprocessing.pool
 import random
+import sys
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+# Above this many motifs in total, segment results are merged by streaming
+# two-way merge rather than a set union (which hashes and holds every motif).
+MERGE_SET_THRESHOLD = 1 << 20
 
 # ====================================================================
 # NbdGenerator (Neighbor Generation) - Corresponds to C++ NbdGenerator
 # ====================================================================
 
 class NbdGenerator:
-    """Generates the (l, d) neighborhood for a kmer, saving results as Motif/Auxif pairs."""
-    def __init__(self, domain_size: int, curr_array: List[Motif], curr_aux_array: List[Auxif], 
-                 x: str, l: int, d: int, leftmost: bool, rightmost: bool):
-        self.domain_size = domain_size
+    """Generates the (l, d) neighborhood for a kmer, saving results as packed motif/wildcard-mask pairs."""
+    def __init__(self, curr_array: List[int], curr_aux_array: List[int], 
+                 packed: int, k: int, l: int, d: int):
         self.curr_array = curr_array
         self.curr_aux_array = curr_aux_array
-        self.x = x
+        self.packed = packed
         self.l = l
         self.d = d
-        self.k = len(x)
-        self.leftmost = leftmost
-        self.rightmost = rightmost
-        self.expanded_count = 0
-
-    def _gen_nbrhood_3(self, alpha: int, count: int):
-        current_len = len(self.x)
-
-        if alpha == 0:
-            if current_len == self.l:
-                motif_encoded_str = "".join(str(c) if c != '-' else '' for c in self.x)
-                if len(motif_encoded_str) == self.l:
-                    self.curr_array.append(Motif(motif_encoded_str))
-                    self.curr_aux_array.append(Auxif(motif_encoded_str, WILDCARD_CODE))
-                    self.expanded_count += count
-            return
-
-        # Insertion
-        for j in range(current_len + 1):
-            original_char = self.x[j] if j < current_len else ''
-
-            temp_x = self.x[:j] + str(WILDCARD_CODE) + self.x[j:]
-            
-            old_x = self.x
-            self.x = temp_x
-            self._gen_nbrhood_3(alpha - 1, count * self.domain_size) 
-            self.x = old_x # Backtrack
-
-
-    def _gen_nbrhood_2(self, sigma: int, alpha: int, count: int):
-        """Handles substitutions."""
-        current_len = len(self.x)
-
-        if sigma == 0:
-            self._gen_nbrhood_3(alpha, count)
-            return
-
-        # Substitution
-        for j in range(current_len):
-            if self.x[j] == '-': continue
-            
-            original_char = self.x[j]
-            
-            old_x = self.x
-            self.x = self.x[:j] + str(WILDCARD_CODE) + self.x[j+1:]
-            self._gen_nbrhood_2(sigma - 1, alpha, count * self.domain_size)
-            self.x = old_x # Backtrack
-
+        self.k = k
 
-    def _gen_nbrhood(self, delta: int, sigma: int, alpha: int, count: int):
-        """Handles deletions."""
-        current_len = len(self.x)
-        
-        if delta == 0:
-            self._gen_nbrhood_2(sigma, alpha, count)
-            return
-
-        # Deletion
-        for j in range(current_len):
-            original_char = self.x[j]
-            
-            old_x = self.x
-            self.x = self.x[:j] + self.x[j+1:]
-            self._gen_nbrhood(delta - 1, sigma, alpha, count)
-            self.x = old_x[:j] + original_char + old_x[j:] # Backtrack
-
-
-    def generate(self) -> int:
+    def generate(self):
         """Entry point for neighborhood generation."""
-        self.expanded_count = 0
-        q = self.k - self.l
+        packed = self.packed
         
-        for delta in range(max(0, q), math.floor((self.d + q) / 2) + 1):
-            alpha = delta - q 
-            sigma = self.d - alpha - delta
-            
-            self._gen_nbrhood(delta, sigma, alpha, 1)
-            
-        return self.expanded_count
+        # Wildcard masks depend only on (k, l, d)
+        self.curr_array.extend(template_fn(self.k, self.l, self.d)(packed))
+        self.curr_aux_array.extend(template_wild_masks(self.k, self.l, self.d))
 
 # ====================================================================
 # Parallel Workload Functions
 # ====================================================================
 
-def _radix_sort_and_intersect(main_array_data: List[Motif], 
-                              curr_array: List[Motif], curr_aux_array: List[Auxif], 
-                              compact_count: int) -> List[Motif]:
-    """Sorts the generated motifs and intersects with the current running result."""
+def _radix_sort_and_intersect(main_array_data: List[int], 
+                              curr_array: List[int], curr_aux_array: List[int], 
+                              compact_count: int, l: int) -> List[int]:
+    """Expands wildcards, sorts the generated motifs and intersects with the current running result."""
     
-    combined_data: List[Motif] = curr_array[:compact_count]
-    combined_data.sort(key=lambda m: m.data)
-
-    # Remove duplicates
-    sorted_motifs: List[Motif] = []
-    last_motif_data = -1
+    combined_data: Set[int] = set()
+    for data, wild_mask in zip(curr_array[:compact_count], curr_aux_array[:compact_count]):
+        if not wild_mask:
+            combined_data.add(data)
+        else:
+            combined_data.update(expand(data, wild_mask, l))
 
-    for motif_obj in combined_data:
-        if motif_obj.data != last_motif_data:
-            sorted_motifs.append(motif_obj)
-            last_motif_data = motif_obj.data
-            
-    # Perform intersection
     if not main_array_data:
-        return sorted_motifs
-    else:
-        result_motifs: List[Motif] = []
-        i = j = 0
-        
-        while i < len(main_array_data) and j < len(sorted_motifs):
-            main_motif = main_array_data[i]
-            sorted_motif = sorted_motifs[j]
-            
-            if main_motif < sorted_motif:
-                i += 1
-            elif main_motif > sorted_motif:
-                j += 1
-            else:
-                result_motifs.append(main_motif)
-                i += 1
-                j += 1
-                
-        return result_motifs
+        return sorted(combined_data)
+
+    # main_array_data is sorted, so filtering it keeps the result sorted
+    return [data for data in main_array_data if data in combined_data]
+
+def _process_works(works: List[Tuple[int, int]], start: int, end: int,
+                   main_array_data: List[int], l: int, d: int) -> List[int]:
+    """Generates the neighborhoods of works[start:end] and intersects them with the running result."""
+    curr_array: List[int] = []
+    curr_aux_array: List[int] = []
+    
+    for j in range(start, end):
+        packed, k = works[j]
+        NbdGenerator(curr_array, curr_aux_array, packed, k, l, d).generate()
+    
+    return _radix_sort_and_intersect(main_array_data, 
+                                     curr_array, curr_aux_array, len(curr_array), l)
 
 class Worker:
     """Manages the workload partitioning for multiprocessing."""
-    def __init__(self, domain_size: int, seq: str, main_array: List[Motif], l: int, d: int):
-        self.domain_size = domain_size
-        self.seq = seq
+    def __init__(self, seq_codes: bytes, main_array: List[int], l: int, d: int,
+                 dedup_kmers: bool = True):
         self.main_array = main_array
         self.l = l
         self.d = d
-        self.m = len(seq)
+        self.m = len(seq_codes)
+        # Each work item is a packed kmer and its length
         self.works: List[Tuple[int, int]] = []
         
         for k in range(self.l - self.d, self.l + self.d + 1):
             if k > 0 and k <= self.m:
-                for i in range(self.m - k + 1):
-                    self.works.append((i, k))
+                kmers = pack_all_kmers(seq_codes, k)
+                if dedup_kmers:
+                    kmers = list(dict.fromkeys(kmers))
+                self.works.extend((packed, k) for packed in kmers)
 
         random.seed(42) 
         random.shuffle(self.works)
 
     def get_load(self) -> int: return len(self.works)
 
-    def process_segment(self, start: int, end: int) -> List[Motif]:
-        """Entry point for multiprocessing pool: executes a segment of work."""
-        curr_array: List[Motif] = []
-        curr_aux_array: List[Auxif] = []
-        
-        for j in range(start, end):
-            i, k = self.works[j]
-            x = self.seq[i : i + k]
-            
-            generator = NbdGenerator(self.domain_size, curr_array, curr_aux_array, 
-                                     x, self.l, self.d, (i<=0), (i+k>=self.m))
-            generator.generate()
-        
-        compact_count = len(curr_array)
-        
-        return _radix_sort_and_intersect(self.main_array, 
-                                          curr_array, curr_aux_array, compact_count)
+    def process_segment(self, start: int, end: int) -> List[int]:
+        """Executes a segment of work in this process."""
+        return _process_works(self.works, start, end, self.main_array, self.l, self.d)
+
+# A pool task: segment bounds plus where to find the shared sequence codes
+# and running result: (start, end, seq_shm, seq_len, main_shm, main_len, l, d, dedup_kmers).
+# main_shm is None while there is no running result yet.
+SegmentTask = Tuple[int, int, str, int, Optional[str], int, int, int, bool]
+
+# Work list of the last sequence seen by this process, keyed by its shared
+# memory name, so a process that runs several segments builds it only once
+_cached_works: Tuple[Optional[str], List[Tuple[int, int]]] = (None, [])
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attaches to a segment owned by the parent process, which alone unlinks it."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Older versions register the segment again, but with the resource tracker
+    # inherited from the parent (see Ems2p.search), where it is already registered
+    return shared_memory.SharedMemory(name=name)
+
+def process_shared_segment(task: SegmentTask) -> List[int]:
+    """
+    Pool entry point: attaches to the shared sequence codes and running result
+    (see Ems2p._gen_all) and processes one segment. Only the task tuple is
+    pickled, never the sequence, the running result or a Worker.
+    """
+    global _cached_works
+    start, end, seq_name, seq_len, main_name, main_len, l, d, dedup_kmers = task
+
+    seq_shm = _attach(seq_name)
+    main_shm = _attach(main_name) if main_name is not None else None
+    try:
+        main_view = main_shm.buf.cast('Q')[:main_len] if main_shm is not None else memoryview(b'')
+        try:
+            if _cached_works[0] != seq_name:
+                _cached_works = (seq_name, Worker(bytes(seq_shm.buf[:seq_len]), [], l, d, dedup_kmers).works)
+
+            return _process_works(_cached_works[1], start, end, main_view, l, d)
+        finally:
+            # Views must be released before the segments can be closed
+            main_view.release()
+    finally:
+        seq_shm.close()
+        if main_shm is not None:
+            main_shm.close()
 
 class Ems2p(MotifFinderBase):
     """
@@ -189,33 +152,25 @@ class Ems2p(MotifFinderBase):
     """
     def __init__(self, input_path: str, l: int, d: int, params: Params):
         super().__init__("ems2p", input_path, l, d, params)
-        self.main_array: List[Motif] = [] 
+        self.main_array: List[int] = [] 
 
     @staticmethod
-    def _merge_motifs(a: List[Motif], b: List[Motif]) -> List[Motif]:
-        """Merges two sorted, unique Motif lists (used in the binary merging tree)."""
-        c: List[Motif] = []
-        i, j = 0, 0
-        
-        while i < len(a) or j < len(b):
-            if j == len(b) or (i < len(a) and a[i] < b[j]):
-                motif_to_add = a[i]
-                i += 1
-            elif i == len(a) or (j < len(b) and b[j] < a[i]):
-                motif_to_add = b[j]
-                j += 1
-            else: # Equal case
-                motif_to_add = a[i]
-                i += 1
-                j += 1
-            
-            if not c or motif_to_add != c[-1]:
-                c.append(motif_to_add)
-                
-        return c
-
-    def _gen_all(self, seq: str):
-        worker = Worker(self.domain_size, seq, self.main_array, self.l, self.d)
+    def _merge_motifs(merged: List[int], segment: List[int]) -> List[int]:
+        """Merges two sorted, unique packed motif lists into one."""
+        if not merged: return segment
+        if not segment: return merged
+        if len(merged) + len(segment) <= MERGE_SET_THRESHOLD:
+            return sorted(set(merged).union(segment))
+
+        # Large inputs: stream a two-way merge instead of hashing every motif
+        motif_set = MotifSet()
+        motif_set.init_add(merged, 0, len(merged))
+        motif_set.init_add(segment, 0, len(segment))
+        return list(motif_set.unique())
+
+    def _gen_all(self, seq_codes: bytes, pool: Optional[mp.pool.Pool]):
+        worker = Worker(seq_codes, self.main_array, self.l, self.d,
+                        self.params.dedup_kmers)
         total_load = worker.get_load()
         num_threads = self.params.num_threads
         ind_load = math.ceil(total_load / num_threads)
@@ -227,41 +182,81 @@ class Ems2p(MotifFinderBase):
             if pos > start: tasks.append((start, pos))
             start = pos
             
-        with mp.Pool(processes=num_threads) as pool:
-            results = pool.starmap(worker.process_segment, tasks)
+        if pool is None:
+            self.main_array = self._merge_results(worker.process_segment(start, end) for start, end in tasks)
+            return
 
-        current_arrays = [r for r in results if r]
-        
-        # Binary merging tree
-        while len(current_arrays) > 1:
-            next_arrays = []
-            for i in range(0, len(current_arrays), 2):
-                if i + 1 < len(current_arrays):
-                    merged = self._merge_motifs(current_arrays[i], current_arrays[i+1])
-                    next_arrays.append(merged)
-                else:
-                    next_arrays.append(current_arrays[i])
-            current_arrays = next_arrays
-
-        if current_arrays:
-            self.main_array = current_arrays[0] 
-        elif not self.main_array:
-            self.main_array = []
+        # Pool processes read the sequence codes and running result from shared
+        # memory; a packed motif (2 bits per char, l <= 32) fits one uint64 slot
+        segments: List[shared_memory.SharedMemory] = []
+        try:
+            seq_shm = shared_memory.SharedMemory(create=True, size=max(1, len(seq_codes)))
+            segments.append(seq_shm)
+            seq_shm.buf[:len(seq_codes)] = seq_codes
+
+            main_name: Optional[str] = None
+            if self.main_array:
+                main_data = array('Q', self.main_array)
+                main_shm = shared_memory.SharedMemory(create=True, size=len(main_data) * main_data.itemsize)
+                segments.append(main_shm)
+                main_shm.buf[:len(main_data) * main_data.itemsize] = main_data.tobytes()
+                main_name = main_shm.name
+
+            shared_tasks: List[SegmentTask] = [
+                (start, end, seq_shm.name, len(seq_codes), main_name, len(self.main_array), self.l, self.d,
+                 self.params.dedup_kmers)
+                for start, end in tasks
+            ]
+            self.main_array = self._merge_results(pool.imap_unordered(process_shared_segment, shared_tasks))
+        finally:
+            for segment in segments:
+                segment.close()
+                segment.unlink()
+
+    @classmethod
+    def _merge_results(cls, results: Iterable[List[int]]) -> List[int]:
+        """
+        Folds each segment result into the running union as soon as it arrives,
+        so at most the union and one segment result are held at a time.
+        """
+        merged: List[int] = []
+        for result in results:
+            merged = cls._merge_motifs(merged, result)
+        return merged
 
 
     def search(self):
-        for i, seq in enumerate(self.reads):
-            print(f"Processing sequence {i} (Parallel) ...")
-            
-            self._gen_all(seq)
-
-            if not self.main_array:
-                self.motifs.clear()
-                print("No common motifs found after intersection. Stopping.")
-                return
-
-        # Decode the final list of Motif objects
-        self.motifs = [m.get_kmer(self.l) for m in self.main_array]
+        # One pool serves every sequence; a single thread runs inline without forking
+        num_threads = self.params.num_threads
+        if num_threads > 1 and self.l > MAX_L:
+            # The running result is shared with pool processes as uint64 slots
+            raise ValueError(f"Requested length {self.l} exceeds max Motif length {MAX_L}")
+        if num_threads > 1:
+            # Build the template functions once here so forked pool processes inherit them
+            for k in range(max(1, self.l - self.d), self.l + self.d + 1):
+                template_fn(k, self.l, self.d)
+            # Start the resource tracker first so pool processes share it and
+            # the segments this process creates and unlinks are tracked once
+            resource_tracker.ensure_running()
+        pool = mp.Pool(processes=num_threads) if num_threads > 1 else None
+
+        try:
+            for i, seq_codes in enumerate(self.read_codes):
+                print(f"Processing sequence {i} (Parallel) ...")
+                
+                self._gen_all(seq_codes, pool)
+
+                if not self.main_array:
+                    self.motifs.clear()
+                    print("No common motifs found after intersection. Stopping.")
+                    return
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        # Decode the final list of packed motifs
+        self.motifs = [unpack_kmer(data, self.l) for data in self.main_array]
         self.motifs.sort()
         
         print(f"Num threads = {self.params.num_threads}")
\ No newline at end of file
@@ -15,6 +15,7 @@ def usage(argv: str):
     print("\t-l <l>          Length (l) of (l,d) motif")
     print("\t-d <d>          Maximum edit distance (d) of (l,d) motif")
     print("\t-t <int>        Number of processes (threads) for Ems2p (default is CPU count)")
+    print("\t--tree          Intersect Ems2 (-s 2) motifs in a trie instead of sorted lists")
     sys.exit(-1)
 
 def main():
@@ -32,12 +33,14 @@ def main():
     
     parser.add_argument('input', nargs='?', help="Input sequence file")
     parser.add_argument('-s', dest='version', default='2', choices=['1', '2', '2m', '2p'], 
-                        help="Algorithm version: 1 (Brute Force), 2 (Fast Trie), 2m (Simple Trie), 2p (Parallel)")
+                        help="Algorithm version: 1 (Brute Force), 2 (Sorted Lists), 2m (Simple Trie), 2p (Parallel)")
     parser.add_argument('-l', dest='l', type=int, default=1, help="Motif length (l)")
     parser.add_argument('-d', dest='d', type=int, default=1, help="Max edit distance (d)")
     parser.add_argument('-t', dest='num_threads', type=int, 
                         default=multiprocessing.cpu_count(), 
                         help="Number of threads/processes for Ems2p")
+    parser.add_argument('--tree', dest='ems2_tree', action='store_true',
+                        help="Intersect ems2 motifs in a MotifTreeFast instead of sorted lists")
     parser.add_argument('-h', '--help', action='store_true', help="Show help message and exit")
 
     args = parser.parse_args()
@@ -46,7 +49,7 @@ def main():
         usage(sys.argv[0])
         return
 
-    params = Params(l=args.l, d=args.d, num_threads=args.num_threads)
+    params = Params(l=args.l, d=args.d, num_threads=args.num_threads, ems2_tree=args.ems2_tree)
     
     if params.l <= 0 or params.d < 0:
         print("Error: l must be > 0 and d must be >= 0.", file=sys.stderr)
@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
 import time
 from typing import List, Tuple
-from utils import Params, read_file, get_out_file, decode_motif, getrusage_maxrss, diffclock, edist
+from utils import Params, read_file, get_out_file, decode_motif, getrusage_maxrss, diffclock, edist_batch, to_codes
 import sys
 import os
 import re
@@ -25,6 +25,9 @@ class MotifFinderBase(ABC):
         # Load file (reads are encoded here)
         self.domain, _ = read_file(input_path, self.reads)
         self.domain_size: int = len(self.domain)
+        # Reads as one code byte (0..3) per base; every search works on these,
+        # and only the motifs found are decoded back to letters for output
+        self.read_codes: List[bytes] = [to_codes(seq) for seq in self.reads]
         
     def _extract_consensus_motif(self, input_path: str) -> str:
         """
@@ -67,17 +70,20 @@ class MotifFinderBase(ABC):
         max_rss = getrusage_maxrss()
         
         # --- Prepare Output with Distance ---
-        final_output_lines = []
+        decoded_motifs = [decode_motif(motif, self.domain) if any(c.isdigit() for c in motif) else motif
+                          for motif in self.motifs]
+        distances: List[object] = ["N/A"] * len(decoded_motifs)
 
-        for motif in self.motifs:
-            decoded_motif = decode_motif(motif, self.domain) if any(c.isdigit() for c in motif) else motif
-            
-            # Calculate distance only if lengths match (required for edit distance comparison)
-            distance = "N/A"
-            if self.consensus_motif and len(decoded_motif) == len(self.consensus_motif):
-                distance = edist(decoded_motif, self.consensus_motif)
-                
-            final_output_lines.append(f"{decoded_motif}\tDistance: {distance}")
+        # Calculate distance only if lengths match (required for edit distance comparison),
+        # once per distinct motif
+        if self.consensus_motif:
+            comparable = list(dict.fromkeys(decoded_motif for decoded_motif in decoded_motifs
+                                            if len(decoded_motif) == len(self.consensus_motif)))
+            distance_of = dict(zip(comparable, edist_batch(comparable, self.consensus_motif)))
+            distances = [distance_of.get(decoded_motif, "N/A") for decoded_motif in decoded_motifs]
+
+        final_output_lines = [f"{decoded_motif}\tDistance: {distance}"
+                              for decoded_motif, distance in zip(decoded_motifs, distances)]
         
         # Write performance to emsTimeMemory.log
         with open(log_path, 'a') as f:
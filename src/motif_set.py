@@ -1,6 +1,6 @@
 import heapq
-from typing import List, Tuple, Any
-from motif_data import Motif
+import itertools
+from typing import Iterator, List, Optional
 
 # ====================================================================
 # MOTIFSET (K-way Merge using Heap)
@@ -9,58 +9,31 @@ from motif_data import Motif
 
 class MotifSet:
     """
-    Implements a min-heap (priority queue) for K-way merging of sorted Motif lists.
+    K-way merge of sorted packed motif lists, built on the C-implemented
+    `heapq.merge` with `itertools.groupby` dropping duplicates.
     """
     def __init__(self):
-        # Heap stores tuples: (Motif_data, List_Index, Element_Index_in_List)
-        self.heap: List[Tuple[int, int, int]] = [] 
-        # Stores the original lists: list of [Motif_array, current_pos, end_pos]
-        self.data_desc: List[List[Any]] = []
-        self.desc_pos: int = 0
-        self.last_popped_motif: Motif = Motif()
+        # Sorted segments added so far, merged lazily on first extraction
+        self.segments: List[Iterator[int]] = []
+        self.merged: Optional[Iterator[int]] = None
 
-    def init_add(self, buffer: List[Motif], start_pos: int, end_pos: int):
+    def init_add(self, buffer: List[int], start_pos: int, end_pos: int):
         """Adds a new sorted list (buffer) segment."""
         if start_pos < end_pos:
-            desc_id = self.desc_pos
-            self.data_desc.append([buffer, start_pos, end_pos])
-            
-            first_motif = buffer[start_pos]
-            heapq.heappush(self.heap, (first_motif.data, desc_id, start_pos))
-            
-            self.desc_pos += 1
+            self.segments.append(itertools.islice(buffer, start_pos, end_pos))
 
     def clear(self):
-        """Clears the heap and descriptors."""
-        self.heap.clear()
-        self.data_desc.clear()
-        self.desc_pos = 0
-        self.last_popped_motif.clear()
-
-    def get_min(self, motif: Motif) -> bool:
-        """Extracts the unique minimum motif, advances the source list."""
-        if not self.heap:
-            return False
-
-        while self.heap:
-            min_data, desc_id, element_idx = heapq.heappop(self.heap)
-
-            buffer, current_pos_ref, end_pos = self.data_desc[desc_id]
-            extracted_motif = buffer[element_idx]
-
-            # Advance the position in the source list
-            self.data_desc[desc_id][1] += 1
-            current_pos = self.data_desc[desc_id][1]
-
-            # Push the next element if list is not exhausted
-            if current_pos < end_pos:
-                next_motif = buffer[current_pos]
-                heapq.heappush(self.heap, (next_motif.data, desc_id, current_pos))
-            
-            # Check for uniqueness against the last returned motif
-            if extracted_motif != self.last_popped_motif:
-                 motif.set(extracted_motif)
-                 self.last_popped_motif.set(extracted_motif)
-                 return True
-                 
-        return False
\ No newline at end of file
+        """Clears the segments and the merge in progress."""
+        self.segments.clear()
+        self.merged = None
+
+    def unique(self) -> Iterator[int]:
+        """Yields every distinct motif of the added segments in ascending order."""
+        if self.merged is None:
+            self.merged = (data for data, _ in itertools.groupby(heapq.merge(*self.segments)))
+        return self.merged
+
+    def get_min(self) -> Optional[int]:
+        """Extracts the unique minimum motif, or None once every segment is exhausted."""
+        # unique() already drops repeats, so no last-popped state is needed
+        return next(self.unique(), None)
@@ -1,16 +1,58 @@
-import sys
-from typing import Dict, Any, List, Optional
+from array import array
+from operator import itemgetter
+from typing import Any, Iterator, List, Optional, Tuple
 from abc import ABC, abstractmethod
 from utils import WILDCARD_CODE, DNA_DOMAIN
+from codegen import NO_NODE, build_fast_tree_fns, build_simple_insert_fns
 
 # Define node allocators based on the C++ structures
-def allocate_node_fast() -> Dict[str, Any]:
-    """Node for MotifTreeFast: array-based children, heavy sharing info."""
-    return {'children': [None] * len(DNA_DOMAIN), 'sharing_info': 0}
+class SimpleNode:
+    """MotifTreeSimple node: list of children, each tagged with its own sharing_info."""
+    __slots__ = ('children', 'sharing_info')
 
-def allocate_node_slow() -> Dict[str, Any]:
+    def __init__(self):
+        self.children: List['SimpleNode'] = []
+        self.sharing_info: int = 0
+
+def allocate_node_slow() -> SimpleNode:
     """Node for MotifTreeSlow equivalent: list-based children."""
-    return {'children': [], 'sharing_info': 0}
+    return SimpleNode()
+
+
+# ====================================================================
+# NODE STORE (struct-of-arrays nodes for MotifTreeFast)
+# Node `nid` owns the child slots children[nid * domain_size + j] (a child
+# node id, or NO_NODE), its sharing_info bitmask and an occupancy bitmask
+# of its non-empty slots. Nodes are appended (the arrays grow
+# geometrically) and never freed one by one; an intersection builds its
+# result in a new store, so the previous tree's store is released whole.
+# ====================================================================
+
+class NodeStore:
+    def __init__(self, domain_size: int):
+        self.domain_size: int = domain_size
+        self.children = array('i')
+        self.sharing = array('B')
+        self.occ = array('B')
+        self.empty_slots = array('i', [NO_NODE] * domain_size)
+
+    @property
+    def node_count(self) -> int: return len(self.sharing)
+
+    def alloc(self, sharing_info: int = 0) -> int:
+        """Allocates an empty node and returns its id."""
+        nid = len(self.sharing)
+        self.children.extend(self.empty_slots)
+        self.sharing.append(sharing_info)
+        self.occ.append(0)
+        return nid
+
+
+# Encoded motif char -> code: '0'..'3' to 0..3, anything else (WILDCARD_STR,
+# '*') to WILDCARD_CODE. Motifs are translated once at insert(), so the
+# recursions index small ints instead of parsing a char per level.
+_TRANS = bytes(c - ord('0') if ord('0') <= c < ord('0') + len(DNA_DOMAIN) else WILDCARD_CODE
+               for c in range(256))
 
 
 # ====================================================================
@@ -18,191 +60,235 @@ def allocate_node_slow() -> Dict[str, Any]:
 # ====================================================================
 
 class MotifTreeBase(ABC):
+    # Whether a finder may take the last intersection from stream_intersect()
+    # instead of intersect() then traverse()
+    STREAM_FINAL: bool = False
+
     def __init__(self, max_depth: int, motifs: List[str], name: str, alloc_func: callable):
         self.domain: str = DNA_DOMAIN
         self.domain_size: int = len(DNA_DOMAIN)
         self.mask: int = (1 << self.domain_size) - 1 # 0b1111
         self.node_allocator = alloc_func
-        self.root: Dict[str, Any] = self.node_allocator()
+        self.root: Any = self.node_allocator()
         self.max_depth: int = max_depth
-        self.x: List[str] = [''] * max_depth # Temporary array for building motifs
+        self.x: bytearray = bytearray(max_depth) # Temporary array for building motifs (ASCII codes)
         self.name: str = name
         self.motifs: List[str] = motifs
 
     @abstractmethod
-    def traverse_recursive(self, node: Dict[str, Any], depth: int): pass
+    def children_of(self, node: Any) -> List[Tuple[int, Any]]:
+        """(code, child) for every code with a child, in ascending code order."""
+        pass
     def traverse(self):
+        """
+        Collects every root-to-leaf path as an encoded motif, in lexicographic
+        order, by an iterative DFS. Each leaf path is copied into one shared
+        byte buffer that is split into motifs at the end.
+        """
         self.motifs.clear()
-        self.traverse_recursive(self.root, 0)
+        max_depth = self.max_depth
+        children_of = self.children_of
+        x = self.x
+        out = bytearray()
+
+        # Entries are (node, depth, code of the edge into node); children are
+        # pushed in reverse so the smallest code is popped first
+        stack: List[Tuple[Any, int, int]] = [(self.root, 0, 0)]
+        while stack:
+            node, depth, code = stack.pop()
+            if depth:
+                x[depth - 1] = 0x30 + code
+            if depth == max_depth:
+                out += x
+                continue
+            for child_code, child in reversed(children_of(node)):
+                stack.append((child, depth + 1, child_code))
+
+        text = out.decode('ascii')
+        self.motifs.extend(text[i:i + max_depth] for i in range(0, len(text), max_depth))
 
     @abstractmethod
-    def insert_recursive(self, node: Dict[str, Any], motif: str, depth: int): pass
-    def insert(self, motif: str): self.insert_recursive(self.root, motif, 0)
+    def insert_recursive(self, node: Any, codes: bytes, depth: int): pass
+    def insert(self, motif: str): self.insert_recursive(self.root, motif.encode('ascii').translate(_TRANS), 0)
 
     @abstractmethod
-    def intersect_recursive(self, to_node: Dict[str, Any], from_node: Dict[str, Any], depth: int) -> Optional[Dict[str, Any]]: pass
+    def intersect_recursive(self, to_node: Any, from_node: Any, depth: int) -> Optional[Any]: pass
     def intersect(self, other: 'MotifTreeBase'):
         new_root = self.intersect_recursive(self.root, other.root, 0)
         self.root = new_root if new_root else self.node_allocator()
 
+    def stream_intersect(self, other: 'MotifTreeBase') -> Iterator[str]:
+        """
+        Yields, in lexicographic order, every encoded motif that is a
+        root-to-leaf path of both trees, by a lockstep DFS of the two trees.
+        Unlike intersect(other) then traverse(), no result tree or motif list
+        is built and neither tree is modified. Tree classes that set
+        STREAM_FINAL stream the same motifs as intersect(other) then
+        traverse(). For MotifTreeFast both are the exact intersection of the
+        inserted pattern sets; MotifTreeSimple can drop patterns at insert, so
+        its result is only as complete as its trees.
+        """
+        max_depth = self.max_depth
+        to_children_of = self.children_of
+        from_children_of = other.children_of
+        x = bytearray(max_depth)
+
+        stack: List[Tuple[Any, Any, int, int]] = [(self.root, other.root, 0, 0)]
+        while stack:
+            to_node, from_node, depth, code = stack.pop()
+            if depth:
+                x[depth - 1] = 0x30 + code
+            if depth == max_depth:
+                yield x.decode('ascii')
+                continue
+            from_children = dict(from_children_of(from_node))
+            for child_code, to_child in reversed(to_children_of(to_node)):
+                from_child = from_children.get(child_code)
+                if from_child is not None:
+                    stack.append((to_child, from_child, depth + 1, child_code))
+
+    def is_empty(self) -> bool: return not self.root.children
+
+    def clear_pool(self):
+        """Drops recycled nodes kept for reuse, if the tree keeps any."""
+        pass
+
 
 # ====================================================================
 # MOTIF TREE FAST (C++ `MotifTreeFast` equivalent)
 # ====================================================================
 
 class MotifTreeFast(MotifTreeBase):
-    def __init__(self, max_depth: int, motifs: List[str], name: str):
-        super().__init__(max_depth, motifs, name, allocate_node_fast)
-
-    def _empty_node(self, node: Dict[str, Any]) -> bool:
-        return all(child is None for child in node['children'])
-    
-    def traverse_recursive(self, node: Dict[str, Any], depth: int):
-        if depth == self.max_depth:
-            self.motifs.append("".join(self.x))
-            return
-
-        for i in range(self.domain_size):
-            child_node = node['children'][i]
-            if child_node is not None:
-                self.x[depth] = str(i) 
-                self.traverse_recursive(child_node, depth + 1)
-
-    def insert_recursive(self, node: Dict[str, Any], motif: str, depth: int):
-        if depth >= self.max_depth: return
-        ch = int(motif[depth]) if motif[depth].isdigit() else WILDCARD_CODE
-
-        if ch == WILDCARD_CODE:
-            current_info = 0
-            for j in range(self.domain_size):
-                child_node = node['children'][j]
-                if child_node is not None and not (current_info & (1 << j)):
-                    self.insert_recursive(child_node, motif, depth + 1)
-                    current_info |= child_node['sharing_info'] 
-            
-            remaining = (~current_info) & self.mask
-            if remaining:
-                new_node = self.node_allocator()
-                new_node['sharing_info'] = remaining
-                for j in range(self.domain_size):
-                    if (remaining & (1 << j)): node['children'][j] = new_node
-                self.insert_recursive(new_node, motif, depth + 1)
-        else:
-            child_mask = (1 << ch)
-            child_node = node['children'][ch]
-            
-            if child_node is None:
-                new_node = self.node_allocator()
-                new_node['sharing_info'] = child_mask
-                node['children'][ch] = new_node
-                self.insert_recursive(new_node, motif, depth + 1)
-            else:
-                old_info = child_node['sharing_info']
-                if old_info & (~child_mask):
-                    old_node = child_node 
-                    new_node = self.node_allocator()
-                    new_node['sharing_info'] = child_mask
-                    old_node['sharing_info'] &= ~child_mask 
-                    node['children'][ch] = new_node 
-                    self.insert_recursive(new_node, motif, depth + 1)
-                else: 
-                    self.insert_recursive(child_node, motif, depth + 1)
-
-    def intersect_recursive(self, to_node: Dict[str, Any], from_node: Optional[Dict[str, Any]], depth: int) -> Optional[Dict[str, Any]]:
-        if depth >= self.max_depth: return to_node 
-        if from_node is None: return None
+    """
+    Nodes are int ids into a NodeStore; self.root is the root's id. Insert and
+    intersect run as plain functions over the store arrays, generated per
+    (max_depth, domain_size) with one function per depth (see codegen.py).
+    """
+    STREAM_FINAL = True
 
-        new_to_node = self.node_allocator()
+    def __init__(self, max_depth: int, motifs: List[str], name: str):
+        self.store = NodeStore(len(DNA_DOMAIN))
+        super().__init__(max_depth, motifs, name, self.store.alloc)
+        self._inserts, self._intersects = build_fast_tree_fns(max_depth, self.domain_size, WILDCARD_CODE)
 
-        for j in range(self.domain_size):
-            to_child_original = to_node['children'][j]
-            from_child_original = from_node['children'][j]
-            
-            if to_child_original is None: continue
+    def _empty_node(self, node: int) -> bool:
+        return self.store.occ[node] == 0
 
-            to_info_original = to_child_original['sharing_info']
-            from_info = from_child_original['sharing_info'] if from_child_original else 0
-            common = to_info_original & from_info
+    def is_empty(self) -> bool: return self._empty_node(self.root)
 
-            if common:
-                intersected_child = self.intersect_recursive(to_child_original, from_child_original, depth + 1)
+    def intersect(self, other: 'MotifTreeFast'):
+        store = NodeStore(self.domain_size)
+        new_root = self.intersect_recursive(self.root, other.root, 0, other.store, store)
+        self.store = store
+        self.node_allocator = store.alloc
+        self.root = new_root if new_root != NO_NODE else store.alloc()
+    
+    def children_of(self, node: int) -> List[Tuple[int, int]]:
+        store = self.store
+        children = store.children
+        base = node * store.domain_size
+        pairs = []
+        pending = store.occ[node]
+        while pending:
+            low = pending & -pending
+            i = low.bit_length() - 1
+            pairs.append((i, children[base + i]))
+            pending ^= low
+        return pairs
 
-                if intersected_child is not None:
-                    intersected_child['sharing_info'] = common
-                    for k in range(self.domain_size):
-                        if common & (1 << k):
-                            new_to_node['children'][k] = intersected_child
-                            new_to_node['sharing_info'] |= (1 << k)
+    def insert_recursive(self, node: int, codes: bytes, depth: int):
+        store = self.store
+        self._inserts[depth](store.children, store.sharing, store.occ, codes, node)
 
-        if self._empty_node(new_to_node) and depth < self.max_depth: return None
-        return new_to_node
+    def intersect_recursive(self, to_node: int, from_node: int, depth: int, from_store: NodeStore,
+                            result_store: NodeStore) -> int:
+        """Intersects the subtrees into `result_store`. Returns NO_NODE if empty."""
+        store = self.store
+        return self._intersects[depth](store.children, store.sharing, store.occ,
+                                       result_store.children, result_store.sharing, result_store.occ,
+                                       from_store.children, from_store.sharing, to_node, from_node)
 
 # ====================================================================
 # MOTIF TREE SIMPLE (C++ `MotifTreeSlow` equivalent for ems2m)
 # ====================================================================
 
 class MotifTreeSimple(MotifTreeBase):
+    STREAM_FINAL = True
+
     def __init__(self, max_depth: int, motifs: List[str], name: str):
-        super().__init__(max_depth, motifs, name, allocate_node_slow)
+        # Freelist of discarded nodes (already reset), reused before allocating new ones
+        self._pool: List[SimpleNode] = []
+        super().__init__(max_depth, motifs, name, self._alloc)
+        # Insert recursion specialized per depth (see codegen.py)
+        self._inserts = build_simple_insert_fns(max_depth, self.domain_size, WILDCARD_CODE)
+
+    def _alloc(self) -> SimpleNode:
+        return self._pool.pop() if self._pool else allocate_node_slow()
+
+    def _free(self, node: SimpleNode):
+        """Resets a node no longer referenced by any tree and returns it to the freelist."""
+        node.children.clear()
+        node.sharing_info = 0
+        self._pool.append(node)
+
+    def clear_pool(self):
+        """Drops the freelist, e.g. once no more intersections will follow."""
+        self._pool.clear()
     
-    def traverse_recursive(self, node: Dict[str, Any], depth: int):
-        if depth == self.max_depth:
-            self.motifs.append("".join(self.x))
-            return
-
-        children_map = {}
-        for child in node['children']:
-            info = child['sharing_info']
-            for j in range(self.domain_size):
-                if info & (1 << j): children_map[j] = child
-                    
-        for i in range(self.domain_size):
-            child_node = children_map.get(i)
-            if child_node is not None:
-                self.x[depth] = str(i) 
-                self.traverse_recursive(child_node, depth + 1)
+    def children_of(self, node: SimpleNode) -> List[Tuple[int, SimpleNode]]:
+        # Sibling sharing_info masks are disjoint (insert only adds a child when
+        # no sibling overlaps, intersect splits them), so each code has one child
+        pairs = []
+        for child in node.children:
+            info = child.sharing_info
+            while info:
+                low = info & -info
+                pairs.append((low.bit_length() - 1, child))
+                info ^= low
+        pairs.sort(key=itemgetter(0))
+        return pairs
 
-    def insert_recursive(self, node: Dict[str, Any], motif: str, depth: int):
-        if depth >= self.max_depth: return
+    def insert_recursive(self, node: SimpleNode, codes: bytes, depth: int):
+        self._inserts[depth](self.node_allocator, node, codes)
 
-        ch = int(motif[depth]) if motif[depth].isdigit() else WILDCARD_CODE
-        target_info = self.mask if ch == WILDCARD_CODE else (1 << ch)
-        
-        found_child = None
-        for child in node['children']:
-            if child['sharing_info'] & target_info:
-                found_child = child
-                break
-                
-        if found_child:
-            self.insert_recursive(found_child, motif, depth + 1)
-        else:
-            new_node = self.node_allocator()
-            new_node['sharing_info'] = target_info
-            node['children'].append(new_node)
-            self.insert_recursive(new_node, motif, depth + 1)
-
-    def intersect_recursive(self, to_node: Dict[str, Any], from_node: Dict[str, Any], depth: int) -> Optional[Dict[str, Any]]:
+    def intersect_recursive(self, to_node: SimpleNode, from_node: SimpleNode, depth: int) -> Optional[SimpleNode]:
         if depth >= self.max_depth: return to_node 
-        if not from_node['children']: return None
+        from_children = from_node.children
+        if not from_children: return None
 
+        # Bound once per call rather than looked up on self per child pair
+        alloc = self.node_allocator
+        free = self._free
+        intersect_recursive = self.intersect_recursive
+        next_depth = depth + 1
         new_children = []
         
-        for to_child in to_node['children']:
-            for from_child in from_node['children']:
-                common = to_child['sharing_info'] & from_child['sharing_info']
+        for to_child in to_node.children:
+            to_info = to_child.sharing_info
+            for from_child in from_children:
+                common = to_info & from_child.sharing_info
                 
                 if common:
-                    new_node = self.node_allocator()
-                    intersected_child = self.intersect_recursive(to_child, from_child, depth + 1)
+                    new_node = alloc()
+                    intersected_child = intersect_recursive(to_child, from_child, next_depth)
                     
                     if intersected_child:
-                        new_node['sharing_info'] = common
-                        new_node['children'] = intersected_child['children']
+                        new_node.sharing_info = common
+                        if intersected_child is to_child:
+                            new_node.children = intersected_child.children
+                        else:
+                            # The returned wrapper only carries children: take them over
+                            # (giving it new_node's empty list) and recycle it
+                            new_node.children, intersected_child.children = \
+                                intersected_child.children, new_node.children
+                            free(intersected_child)
                         new_children.append(new_node)
+                    else:
+                        free(new_node)
 
-        if not new_children and depth < self.max_depth: return None
+        # depth < max_depth always holds here (checked on entry)
+        if not new_children: return None
         
-        new_to_node = self.node_allocator()
-        new_to_node['children'] = new_children
-        return new_to_node
\ No newline at end of file
+        new_to_node = alloc()
+        new_to_node.children = new_children
+        return new_to_node
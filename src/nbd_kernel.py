@@ -0,0 +1,113 @@
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from codegen import build_template_fn
+
+# ====================================================================
+# NEIGHBORHOOD KERNEL (shared by Ems2 and Ems2p)
+# The positions a (delta, sigma, alpha) edit touches depend only on
+# (k, l, d), never on the kmer itself. Every edit pattern is therefore
+# precomputed once as a template and applied to bit-packed kmers (see
+# bit_motif.py) with a few shifts and masks, unrolled into one generated
+# function per (k, l, d) by codegen.build_template_fn. A finished length-l pattern
+# is a packed motif (wildcard lanes are 0) plus a wildcard mask with 1 bit
+# per char in the same lane order.
+# ====================================================================
+
+# A template is (blocks, wild_mask); each block (src_shift, dst_shift, mask)
+# copies a run of consecutive kmer chars into the pattern.
+Template = Tuple[Tuple[Tuple[int, int, int], ...], int]
+
+_DELETED = -1
+
+def _shapes_3(shape: Tuple[Optional[int], ...], alpha: int, l: int, shapes: Dict[tuple, None]):
+    """Handles insertions ('*')."""
+    if alpha == 0:
+        # Base Case: shape is complete. Filter out deletion markers ('-')
+        final = tuple(c for c in shape if c != _DELETED)
+        if len(final) == l:
+            shapes[final] = None
+        return
+
+    for j in range(len(shape) + 1):
+        if j < len(shape) and shape[j] is None: continue
+        _shapes_3(shape[:j] + (None,) + shape[j:], alpha - 1, l, shapes)
+
+
+def _shapes_2(shape: Tuple[Optional[int], ...], sigma: int, alpha: int, l: int, shapes: Dict[tuple, None]):
+    """Handles substitutions ('*')."""
+    if sigma == 0:
+        _shapes_3(shape, alpha, l, shapes)
+        return
+
+    for j in range(len(shape)):
+        if shape[j] == _DELETED: continue
+        _shapes_2(shape[:j] + (None,) + shape[j+1:], sigma - 1, alpha, l, shapes)
+
+
+def _shapes(shape: Tuple[Optional[int], ...], delta: int, sigma: int, alpha: int, l: int,
+            shapes: Dict[tuple, None]):
+    """Handles deletions ('-')."""
+    if delta == 0:
+        _shapes_2(shape, sigma, alpha, l, shapes)
+        return
+
+    for j in range(len(shape)):
+        _shapes(shape[:j] + (_DELETED,) + shape[j+1:], delta - 1, sigma, alpha, l, shapes)
+
+
+def _compile(shape: Tuple[Optional[int], ...], k: int) -> Template:
+    """Turns a shape (kmer index, or None for '*', per pattern char) into shift/mask blocks."""
+    l = len(shape)
+    blocks: List[Tuple[int, int, int]] = []
+    wild_mask = 0
+    j = 0
+    while j < l:
+        if shape[j] is None:
+            wild_mask |= 1 << (l - 1 - j)
+            j += 1
+            continue
+        run = 1
+        while j + run < l and shape[j + run] is not None and shape[j + run] == shape[j] + run:
+            run += 1
+        last = j + run - 1
+        blocks.append((2 * (k - 1 - shape[last]), 2 * (l - 1 - last), (1 << (2 * run)) - 1))
+        j += run
+    return tuple(blocks), wild_mask
+
+
+@lru_cache(maxsize=None)
+def build_templates(k: int, l: int, d: int) -> Tuple[Template, ...]:
+    """Templates for every distinct length-l edit pattern of a length-k kmer."""
+    shapes: Dict[tuple, None] = {}
+    q = k - l
+    for delta in range(max(0, q), (d + q) // 2 + 1):
+        alpha = delta - q
+        sigma = d - alpha - delta
+        _shapes(tuple(range(k)), delta, sigma, alpha, l, shapes)
+    return tuple(_compile(shape, k) for shape in shapes)
+
+
+@lru_cache(maxsize=None)
+def template_wild_masks(k: int, l: int, d: int) -> Tuple[int, ...]:
+    """Wildcard masks of build_templates(k, l, d), in the same order."""
+    return tuple(template[1] for template in build_templates(k, l, d))
+
+
+@lru_cache(maxsize=None)
+def template_fn(k: int, l: int, d: int) -> Callable[[int], tuple]:
+    """All templates of (k, l, d) compiled into one function of the packed kmer (see codegen.py)."""
+    return build_template_fn(build_templates(k, l, d), f"templates k={k} l={l} d={d}")
+
+
+def gen_unique(packed: int, k: int, l: int, d: int, out: List[int], aux_out: List[int]):
+    """
+    Generates the (l, d) neighborhood patterns of a length-k kmer across all
+    (delta, sigma, alpha) partitions, appending each distinct pattern once.
+    """
+    visited = set()
+    for motif, wild in zip(template_fn(k, l, d)(packed), template_wild_masks(k, l, d)):
+        key = (wild << (2 * l)) | motif
+        if key not in visited:
+            visited.add(key)
+            out.append(motif)
+            aux_out.append(wild)
@@ -3,6 +3,7 @@ import sys
 import time
 import os
 import math
+from functools import lru_cache
 from typing import List, Tuple, Dict, Any, Union
 
 # --- Windows Compatibility Fix for Memory Tracking ---
@@ -33,6 +34,9 @@ DNA_DOMAIN = "ACGT"
 ENCODING_MAP = {char: i for i, char in enumerate(DNA_DOMAIN)}
 DECODING_MAP = {i: char for i, char in enumerate(DNA_DOMAIN)}
 WILDCARD_CODE = len(DNA_DOMAIN)
+# String forms of the codes, so hot loops index a tuple instead of calling str()
+WILDCARD_STR = str(WILDCARD_CODE)
+CODE_STR = tuple(str(i) for i in range(WILDCARD_CODE + 1))
 
 uchar = int
 uint32 = int
@@ -42,28 +46,43 @@ uint64 = int
 # FILE I/O AND SEQUENCE PROCESSING
 # ====================================================================
 
-def get_alphabet(raw_strings: List[str]) -> str:
+def get_alphabet(raw_strings: List[bytes]) -> str:
     return DNA_DOMAIN
 
+@lru_cache(maxsize=None)
+def _encode_table(domain: str) -> bytes:
+    """Translate table: each domain char (either case) to its code digit, anything else to '0'."""
+    table = bytearray(b'0' * 256)
+    for i, char in enumerate(domain):
+        table[ord(char.upper())] = table[ord(char.lower())] = ord('0') + i
+    return bytes(table)
+
 def encode_strings(raw_reads: List[str], domain: str) -> List[str]:
-    encoding_map = {char: str(i) for i, char in enumerate(domain)}
-    encoded_reads = []
-    for read_seq in raw_reads:
-        encoded_seq = "".join(encoding_map.get(char, '0') for char in read_seq.upper())
-        encoded_reads.append(encoded_seq)
-    return encoded_reads
+    table = _encode_table(domain)
+    # Non-ASCII chars become '?' (one byte each), which the table maps to '0'
+    return [read_seq.encode('ascii', 'replace').translate(table).decode('ascii') for read_seq in raw_reads]
+
+@lru_cache(maxsize=None)
+def _read_table(domain: str) -> bytes:
+    """_encode_table with U/u folded onto T, so a raw read line is encoded by one translate."""
+    table = bytearray(_encode_table(domain))
+    table[ord('U')] = table[ord('u')] = table[ord('T')]
+    return bytes(table)
 
 def read_file(filepath: str, reads: Reads) -> Tuple[str, List[str]]:
-    raw_reads = []
+    raw_reads: List[bytes] = []
     try:
-        with open(filepath, 'r') as f:
+        # Binary mode: no UTF-8 decoding, and case folding, U->T and encoding
+        # all happen in the single translate below
+        with open(filepath, 'rb') as f:
             for line in f:
-                line = line.strip().upper().replace('U', 'T')
-                if line and not line.startswith('>'): 
+                line = line.strip()
+                if line and line[:1] != b'>': 
                     raw_reads.append(line)
         
         domain = get_alphabet(raw_reads) 
-        encoded_sequences = encode_strings(raw_reads, domain)
+        table = _read_table(domain)
+        encoded_sequences = [raw_read.translate(table).decode('ascii') for raw_read in raw_reads]
         
         reads.clear()
         reads.extend(encoded_sequences)
@@ -74,16 +93,35 @@ def read_file(filepath: str, reads: Reads) -> Tuple[str, List[str]]:
         print(f"ERROR: could not open file {filepath}", file=sys.stderr)
         sys.exit(-1)
 
+# Maps an encoded read ('0'..'3') to raw 2-bit code bytes
+_DIGIT_TO_CODE = bytes.maketrans(b'0123', b'\x00\x01\x02\x03')
+
+def to_codes(encoded_seq: str) -> bytes:
+    """Converts an encoded read to one code byte (0..3) per char."""
+    return encoded_seq.encode('ascii').translate(_DIGIT_TO_CODE)
+
+def pack_all_kmers(seq_codes: bytes, k: int) -> List[int]:
+    """Packs every k-mer of a code sequence (2 bits/char, see bit_motif.py), in start order."""
+    mask = (1 << (2 * k)) - 1
+    kmers: List[int] = []
+    packed = 0
+    for i, code in enumerate(seq_codes):
+        packed = ((packed << 2) | code) & mask
+        if i >= k - 1:
+            kmers.append(packed)
+    return kmers
+
+@lru_cache(maxsize=None)
+def _decode_table(domain: str) -> bytes:
+    """Translate table: code digits to domain chars ('?' past the domain), WILDCARD and non-digits to '*'."""
+    table = bytearray(b'*' * 256)
+    for code in range(10):
+        table[ord('0') + code] = ord(domain[code]) if code < len(domain) else ord('?')
+    table[ord(WILDCARD_STR)] = ord('*')
+    return bytes(table)
+
 def decode_motif(encoded_motif: str, domain: str) -> str:
-    decoding_map = {i: char for i, char in enumerate(domain)}
-    decoded_seq = ""
-    for char_code_str in encoded_motif:
-        code = int(char_code_str) if char_code_str.isdigit() else WILDCARD_CODE
-        if code == WILDCARD_CODE:
-             decoded_seq += '*'
-        else:
-             decoded_seq += decoding_map.get(code, '?')
-    return decoded_seq
+    return encoded_motif.encode('ascii', 'replace').translate(_decode_table(domain)).decode('ascii')
 
 def remove_extension(filename: str) -> str:
     return os.path.splitext(filename)[0]
@@ -111,43 +149,78 @@ def get_out_file(input_path: str, l: int, d: int, name: str) -> str:
 def diffclock(start_time: float) -> float:
     return time.time() - start_time
 
+def _peq(pattern: str) -> Dict[str, int]:
+    """Bitmask per char of the positions (bit i = pattern[i]) where it occurs in the pattern."""
+    peq: Dict[str, int] = {}
+    for i, c in enumerate(pattern):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    return peq
+
+def _edist_bits(peq: Dict[str, int], m: int, text: str, search: bool = False, bound: int = -1) -> int:
+    """
+    Myers/Hyyro bit-parallel edit distance between a length-m pattern (given
+    by its _peq masks) and text: one whole DP column of vertical deltas is
+    advanced per text char with a few int ops (Python ints have no 64-bit limit).
+    In search mode (Sellers) the top DP row stays 0, so a match may start
+    anywhere and score is the best distance of a substring ending at the
+    current char; the scan stops as soon as score <= bound.
+    """
+    if m == 0: return 0 if search else len(text)
+    all_ones = (1 << m) - 1
+    high = 1 << (m - 1)
+    # The top row grows by one per text char, unless matches may start anywhere
+    top = 0 if search else 1
+    pv, mv, score = all_ones, 0, m
+
+    for c in text:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & all_ones)
+        mh = pv & xh
+        if ph & high: score += 1
+        elif mh & high: score -= 1
+        ph = ((ph << 1) | top) & all_ones
+        mh = (mh << 1) & all_ones
+        pv = mh | (~(xv | ph) & all_ones)
+        mv = ph & xv
+        if score <= bound:
+            return score
+
+    return score
+
 def edist(s1: str, s2: str) -> int:
     """Calculates the Edit Distance (Levenshtein distance)."""
-    len1, len2 = len(s1), len(s2)
-    d = [[0] * (len2 + 1) for _ in range(len1 + 1)]
+    return _edist_bits(_peq(s2), len(s2), s1)
 
-    for i in range(len1 + 1): d[i][0] = i
-    for j in range(len2 + 1): d[0][j] = j
-
-    for i in range(1, len1 + 1):
-        for j in range(1, len2 + 1):
-            cost = 0 if s1[i - 1] == s2[j - 1] else 1
-            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + cost)
-            
-    return d[len1][len2]
+def edist_batch(candidates: List[str], target: str) -> List[int]:
+    """Edit distance from every candidate to the same target, building the target's bitmasks once."""
+    peq = _peq(target)
+    len2 = len(target)
+    return [_edist_bits(peq, len2, s1) for s1 in candidates]
 
 def found_in_seq(candidate: str, seq: str, l: int, d: int) -> bool:
-    m = len(seq)
-    len_candi = len(candidate)
-    
-    for q in range(-d, d + 1):
-        k = len_candi + q 
-        
-        if k <= 0 or k > m: continue
-            
-        for i in range(m - k + 1):
-            x = seq[i : i + k]
-            if edist(x, candidate) <= d:
-                return True
-                
-    return False
+    """
+    True if some non-empty substring of seq is within edit distance d of the
+    candidate (such a substring has length within d of the candidate's).
+    Single pass over seq with _edist_bits in search mode.
+    """
+    if not seq: return False
+    # Only an empty candidate could otherwise match the (excluded) empty substring
+    if not candidate: return d >= 1
+    return _edist_bits(_peq(candidate), len(candidate), seq, search=True, bound=d) <= d
 
 # ====================================================================
 # PARAMS structure
 # ====================================================================
 
 class Params:
-    def __init__(self, l: int = 1, d: int = 1, num_threads: int = 1):
+    def __init__(self, l: int = 1, d: int = 1, num_threads: int = 1, dedup_kmers: bool = True,
+                 ems2_tree: bool = False):
         self.l = l
         self.d = d
-        self.num_threads = num_threads
\ No newline at end of file
+        self.num_threads = num_threads
+        # Expand each distinct k-mer of a read once (neighborhoods are only used as sets)
+        self.dedup_kmers = dedup_kmers
+        # Intersect ems2 motifs in a MotifTreeFast instead of sorted packed lists
+        self.ems2_tree = ems2_tree
\ No newline at end of file